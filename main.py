@@ -1,26 +1,48 @@
+import asyncio
+import hmac
+import logging
 import os
 import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, Tuple
 
 import httpx
-from fastapi import FastAPI, HTTPException, Query
-from xml.etree import ElementTree as ET
+import orjson
+from ciso8601 import parse_datetime
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from lxml import etree
 
-app = FastAPI(title="MT5 US News Blackout Bridge")
+log = logging.getLogger(__name__)
 
 # =========================
 # ENV
 # =========================
 BRIDGE_TOKEN = os.getenv("BRIDGE_TOKEN", "")
+_TOKEN_BYTES = BRIDGE_TOKEN.encode()
 
 # Blackout window (minutes)
 DEFAULT_PRE_MIN = int(os.getenv("PRE_MINUTES", "10"))
 DEFAULT_POST_MIN = int(os.getenv("POST_MINUTES", "30"))
 
 # Cache to reduce upstream hits
-_CACHE: Dict[str, Any] = {"ts": 0.0, "data": None}
-CACHE_TTL_SEC = int(os.getenv("CACHE_TTL_SEC", "300"))  # 5 min default
+# TTL adapts to the calendar: refresh often close to the next event, rarely
+# when it is hours away. CACHE_TTL_SEC is the ceiling.
+CACHE_TTL_SEC = int(os.getenv("CACHE_TTL_SEC", "900"))  # 15 min default
+CACHE_TTL_MIN_SEC = int(os.getenv("CACHE_TTL_MIN_SEC", "30"))
+# Aim to have a fresh snapshot before the next event's blackout window opens;
+# defaults to the configured pre-window
+CACHE_REFRESH_LEAD_SEC = int(os.getenv("CACHE_REFRESH_LEAD_SEC", str(DEFAULT_PRE_MIN * 60)))
+# Past TTL a stale snapshot is still served while a refresh runs, up to this age
+HARD_TTL_SEC = CACHE_TTL_SEC * 4
+
+# Calendar source: "ff" (ForexFactory XML) or "te" (Trading Economics JSON)
+CAL_SOURCE = os.getenv("CAL_SOURCE", "ff").lower()
 
 # ForexFactory calendar XML (via faireconomy)
 # We will parse events and filter USD high impact.
@@ -29,15 +51,87 @@ FF_THISWEEK_URL = os.getenv(
     "https://nfs.faireconomy.media/ff_calendar_thisweek.xml"
 )
 
+# Trading Economics calendar API, US events (importance 3 = high)
+TE_CAL_URL = os.getenv(
+    "TE_CAL_URL",
+    "https://api.tradingeconomics.com/calendar/country/united%20states"
+)
+TE_API_KEY = os.getenv("TE_API_KEY", "guest:guest")
+
 # =========================
-# HELPERS
+# CACHE
+# =========================
+@dataclass(slots=True, frozen=True)
+class Snap:
+    """
+    Immutable calendar snapshot, stored column-wise: "epochs" is a sorted
+    float buffer the route bisects, "titles" is parallel to it and only
+    touched on a hit. Every event is USD / High by construction.
+    """
+    ts: float
+    expires_at: float
+    epochs: array
+    titles: Tuple[str, ...]
+    # Validators from the upstream response, replayed on the next refresh
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+# Swapped wholesale on refresh, never mutated: readers grab the reference once
+# and always see a consistent epochs/titles pair.
+_snap: Optional[Snap] = None
+
+# Single-flight refresh: at most one upstream fetch runs at a time, and every
+# request that misses the cache shares the same in-flight task.
+_refresh_lock = asyncio.Lock()
+_refresh_task: Optional["asyncio.Task[Snap]"] = None
+
+# =========================
+# HTTP CLIENT
 # =========================
-def _now_utc() -> datetime:
-    return datetime.now(timezone.utc)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client for the whole process: keep-alive connections are
+    # reused across cache misses instead of paying TCP + TLS on every fetch.
+    app.state.http = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=300),
+        timeout=httpx.Timeout(connect=5, read=10, write=5, pool=5),
+        http2=True,
+        follow_redirects=True,
+    )
+    refresher = asyncio.create_task(_refresher(app.state.http))
+    try:
+        yield
+    finally:
+        # The refresher only awaits the shared refresh through a shield, so
+        # stop that task too before closing the client under it.
+        tasks = [t for t in (refresher, _refresh_task) if t is not None]
+        for task in tasks:
+            task.cancel()
+        # return_exceptions: a refresh that already failed must not break shutdown
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await app.state.http.aclose()
+
+app = FastAPI(
+    title="MT5 US News Blackout Bridge",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
-def _safe_text(el: Optional[ET.Element]) -> str:
+def _get_http(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http
+
+# The only USD / High filter for the FF feed: exact spellings matched per
+# element in _parse_ff_event, so there is no per-event case folding.
+_USD_VALUES = frozenset(("USD", "usd", "Usd"))
+_HIGH_VALUES = frozenset(("High", "high", "HIGH"))
+
+# =========================
+# HELPERS
+# =========================
+def _safe_text(el: Optional[etree._Element]) -> str:
     return (el.text or "").strip() if el is not None else ""
 
+@lru_cache(maxsize=2048)
 def _parse_epoch_utc(s: str) -> Optional[datetime]:
     """
     Some FF XML feeds include <timestamp> as epoch seconds.
@@ -51,128 +145,344 @@ def _parse_epoch_utc(s: str) -> Optional[datetime]:
     except Exception:
         return None
 
-def _is_blackout(now: datetime, event_time: datetime, pre_min: int, post_min: int) -> bool:
-    start = event_time.timestamp() - (pre_min * 60)
-    end = event_time.timestamp() + (post_min * 60)
-    return start <= now.timestamp() <= end
+@lru_cache(maxsize=2048)
+def _parse_iso_utc(s: str) -> Optional[datetime]:
+    """
+    ISO-8601 string to an aware datetime; assumes UTC if no tz info.
+    """
+    try:
+        if not s:
+            return None
+        dt = parse_datetime(s)
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+def _parse_date_time_utc(date_s: str, time_s: str) -> Optional[datetime]:
+    """
+    Fallback when there is no <timestamp>: combine <date> and <time>.
+    Assumes UTC if no tz info (less ideal but usable).
+    """
+    # Expected formats vary; keep conservative.
+    # If parsing fails, skip.
+    if date_s and time_s and time_s.lower() not in ("all day", "tentative"):
+        # Try: YYYY-MM-DD + HH:MM
+        # If date is like "2025-12-28"
+        return _parse_iso_utc(f"{date_s}T{time_s}:00")
+    return None
+
+def _parse_ff_event(ev: etree._Element) -> Optional[Tuple[float, str]]:
+    """
+    Turn one <event> element into (epoch seconds, title), or None if it is
+    not a USD high-impact event with a usable time.
+    """
+    # ForexFactory feeds typically tag currency as USD for US events
+    currency = _safe_text(ev.find("currency")) or _safe_text(ev.find("country"))
+    impact = _safe_text(ev.find("impact"))
+
+    # Keep it strict: US = USD and High impact
+    if currency not in _USD_VALUES or impact not in _HIGH_VALUES:
+        return None
+
+    title = _safe_text(ev.find("title")) or _safe_text(ev.find("event"))
+    timestamp = _safe_text(ev.find("timestamp"))  # best-case
+    dt = _parse_epoch_utc(timestamp)
+
+    # If no timestamp exists, try date+time (fallback).
+    # Some feeds have <date> and <time> but timezone can vary; timestamp is preferred.
+    if dt is None:
+        dt = _parse_date_time_utc(_safe_text(ev.find("date")), _safe_text(ev.find("time")))
+
+    if dt is None:
+        return None
+
+    return dt.timestamp(), title
+
+def _adaptive_ttl(epochs: Sequence[float], now_ts: float) -> float:
+    """
+    Cache lifetime for a snapshot: until shortly before the next upcoming
+    event, clamped to [CACHE_TTL_MIN_SEC, CACHE_TTL_SEC].
+    """
+    i = bisect_right(epochs, now_ts)
+    if i == len(epochs):
+        return CACHE_TTL_SEC
+    return max(CACHE_TTL_MIN_SEC, min(CACHE_TTL_SEC, epochs[i] - now_ts - CACHE_REFRESH_LEAD_SEC))
+
+# =========================
+# PROVIDERS
+# =========================
+class Provider(Protocol):
+    """
+    One upstream calendar feed. Caching, revalidation and the blackout
+    lookup are shared; a provider only says where to fetch and how to turn
+    a 200 response into (epochs, titles) of USD high-impact events.
+    """
+    source: str
+    url: str
+    params: Dict[str, str]
+
+    async def read(self, r: httpx.Response) -> Tuple[array, List[str]]:
+        ...
+
+class FFProvider:
+    source = "ff_thisweek_xml"
+    url = FF_THISWEEK_URL
+    params: Dict[str, str] = {}
+
+    async def read(self, r: httpx.Response) -> Tuple[array, List[str]]:
+        # Stream the body into a pull parser so parsing overlaps the download
+        # and only one <event> subtree is alive at a time. Every byte goes
+        # through the parser, so close() still rejects a damaged document.
+        epochs = array("d")
+        titles: List[str] = []
+        head = b""
+        parser = etree.XMLPullParser(events=("end",), tag="event")
+        try:
+            async for chunk in r.aiter_bytes():
+                if len(head) < 300:
+                    head += chunk[:300 - len(head)]
+                parser.feed(chunk)
+                self._collect(parser, epochs, titles)
+            parser.close()
+            self._collect(parser, epochs, titles)
+        except etree.XMLSyntaxError:
+            upstream_body = head.decode("utf-8", "replace")
+            raise HTTPException(status_code=502, detail=f"Upstream returned invalid XML | {upstream_body}")
+        return epochs, titles
+
+    @staticmethod
+    def _collect(parser: etree.XMLPullParser, epochs: array, titles: List[str]) -> None:
+        # Common structure: <weeklyevents><event>...</event></weeklyevents>
+        for _, el in parser.read_events():
+            # Only "end" events are requested, which always carry an element
+            if not isinstance(el, etree._Element):
+                continue
+            parent = el.getparent()
+            # Some feeds carry the title as a nested <event>; leave it in
+            # place for the enclosing event's title fallback.
+            if parent is not None and parent.tag == "event":
+                continue
+            # No pre-parse filter: every event is fully built by lxml so the
+            # whole document stays checked for well-formedness, and the
+            # currency/impact check happens in _parse_ff_event as before.
+            ev = _parse_ff_event(el)
+            if ev is not None:
+                epochs.append(ev[0])
+                titles.append(ev[1])
+            # Drop the handled event and its already-handled siblings
+            el.clear()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+
+class TEProvider:
+    source = "te_calendar_json"
+    url = TE_CAL_URL
+    params = {"c": TE_API_KEY, "importance": "3", "f": "json"}
+
+    async def read(self, r: httpx.Response) -> Tuple[array, List[str]]:
+        raw = await r.aread()
+        try:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            upstream_body = raw[:300].decode("utf-8", "replace")
+            raise HTTPException(status_code=502, detail=f"Upstream returned invalid JSON | {upstream_body}")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=502, detail="Upstream returned unexpected JSON")
+
+        epochs = array("d")
+        titles: List[str] = []
+        for row in data:
+            if not isinstance(row, dict):
+                continue
+            # Keep it strict: US and high importance, even if the URL is overridden
+            if row.get("Importance") != 3 or row.get("Country", "United States") != "United States":
+                continue
+            date_s = row.get("Date") or ""
+            title = row.get("Event") or ""
+            # Malformed rows are skipped, not allowed to fail the whole refresh
+            if not isinstance(date_s, str) or not isinstance(title, str):
+                continue
+            dt = _parse_iso_utc(date_s)
+            if dt is None:
+                continue
+            epochs.append(dt.timestamp())
+            titles.append(title.strip())
+        return epochs, titles
+
+PROVIDERS: Dict[str, Callable[[], Provider]] = {"ff": FFProvider, "te": TEProvider}
+if CAL_SOURCE not in PROVIDERS:
+    raise RuntimeError(f"Unknown CAL_SOURCE {CAL_SOURCE!r}; expected one of: {', '.join(PROVIDERS)}")
+PROVIDER: Provider = PROVIDERS[CAL_SOURCE]()
 
 # =========================
 # CALENDAR FETCH
 # =========================
-async def _fetch_us_high_impact_events() -> List[Dict[str, Any]]:
-    # Cache
+async def _download_snapshot(client: httpx.AsyncClient) -> Snap:
+    global _snap
+
     now_ts = time.time()
-    if _CACHE["data"] is not None and (now_ts - _CACHE["ts"]) < CACHE_TTL_SEC:
-        return _CACHE["data"]
 
-    async with httpx.AsyncClient(timeout=15.0, follow_redirects=True) as client:
-        r = await client.get(FF_THISWEEK_URL)
+    # Conditional GET: an unchanged feed comes back as an empty 304
+    prev = _snap
+    headers: Dict[str, str] = {}
+    if prev is not None:
+        if prev.etag:
+            headers["If-None-Match"] = prev.etag
+        if prev.last_modified:
+            headers["If-Modified-Since"] = prev.last_modified
+
+    async with client.stream("GET", PROVIDER.url, params=PROVIDER.params, headers=headers) as r:
+        if r.status_code == 304 and prev is not None:
+            # Same calendar: keep the parsed columns, just renew the lifetime
+            s = replace(
+                prev,
+                ts=now_ts,
+                expires_at=now_ts + _adaptive_ttl(prev.epochs, now_ts),
+            )
+            _snap = s
+            return s
 
         if r.status_code != 200:
+            await r.aread()
             upstream_body = (r.text or "")[:300]
             raise HTTPException(
                 status_code=502,
                 detail=f"Calendar upstream error: {r.status_code} | {upstream_body}"
             )
 
-    xml_text = r.text
-    try:
-        root = ET.fromstring(xml_text)
-    except Exception:
-        upstream_body = (xml_text or "")[:300]
-        raise HTTPException(status_code=502, detail=f"Upstream returned invalid XML | {upstream_body}")
-
-    events: List[Dict[str, Any]] = []
-
-    # Common structure: <weeklyevents><event>...</event></weeklyevents>
-    for ev in root.findall(".//event"):
-        # ForexFactory feeds typically tag currency as USD for US events
-        currency = _safe_text(ev.find("currency")) or _safe_text(ev.find("country"))
-        impact = _safe_text(ev.find("impact"))
-
-        # Keep it strict: US = USD and High impact
-        if currency.upper() != "USD":
-            continue
-        if impact.lower() != "high":
-            continue
-
-        title = _safe_text(ev.find("title")) or _safe_text(ev.find("event"))
-        timestamp = _safe_text(ev.find("timestamp"))  # best-case
-        dt = _parse_epoch_utc(timestamp)
-
-        # If no timestamp exists, try date+time (fallback).
-        # Some feeds have <date> and <time> but timezone can vary; timestamp is preferred.
-        if dt is None:
-            date_s = _safe_text(ev.find("date"))
-            time_s = _safe_text(ev.find("time"))
-            try:
-                # Fallback assumes UTC if no tz info (less ideal but usable)
-                # Expected formats vary; keep conservative.
-                # If parsing fails, skip.
-                if date_s and time_s and time_s.lower() not in ("all day", "tentative"):
-                    # Try: YYYY-MM-DD + HH:MM
-                    # If date is like "2025-12-28"
-                    dt_guess = datetime.fromisoformat(f"{date_s}T{time_s}:00")
-                    dt = dt_guess.replace(tzinfo=timezone.utc)
-            except Exception:
-                dt = None
-
-        if dt is None:
-            continue
-
-        events.append(
+        epochs, titles = await PROVIDER.read(r)
+
+    # Feed order is not guaranteed; sort both columns by time for bisect
+    order = sorted(range(len(epochs)), key=epochs.__getitem__)
+    epochs = array("d", (epochs[i] for i in order))
+    s = Snap(
+        ts=now_ts,
+        expires_at=now_ts + _adaptive_ttl(epochs, now_ts),
+        epochs=epochs,
+        titles=tuple(titles[i] for i in order),
+        etag=r.headers.get("etag"),
+        last_modified=r.headers.get("last-modified"),
+    )
+    _snap = s
+    return s
+
+async def _refresh_snapshot(client: httpx.AsyncClient) -> Snap:
+    async with _refresh_lock:
+        return await _download_snapshot(client)
+
+def _consume_refresh_error(task: "asyncio.Task[Snap]") -> None:
+    # Background refreshes may fail with nobody awaiting them; log and mark
+    # the exception as retrieved. The last good snapshot keeps being served.
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        log.warning("Calendar refresh failed; serving last snapshot", exc_info=exc)
+
+async def _fetch_us_high_impact_events(client: httpx.AsyncClient, force: bool = False) -> Snap:
+    global _refresh_task
+
+    # Cache
+    now_ts = time.time()
+    s = _snap
+    if not force and s is not None and now_ts < s.expires_at:
+        return s
+
+    task = _refresh_task
+    if task is None or task.done():
+        task = asyncio.create_task(_refresh_snapshot(client))
+        task.add_done_callback(_consume_refresh_error)
+        _refresh_task = task
+
+    # Stale-while-revalidate: answer from the old snapshot while it refreshes
+    if not force and s is not None and (now_ts - s.ts) < HARD_TTL_SEC:
+        return s
+
+    # Nothing usable yet (or forced): wait on the shared fetch. Shielded so
+    # one cancelled request does not abort the refresh for everyone else.
+    return await asyncio.shield(task)
+
+async def _refresher(client: httpx.AsyncClient) -> None:
+    """
+    Keep the snapshot warm so user requests never wait on the upstream:
+    refresh, then sleep until the snapshot's adaptive expiry.
+    """
+    while True:
+        try:
+            s = await _fetch_us_high_impact_events(client, force=True)
+            delay = s.expires_at - time.time()
+        except Exception:
+            # Upstream hiccup: keep serving the last snapshot and retry soon.
+            # The failure is logged by _consume_refresh_error on the shared task.
+            delay = CACHE_TTL_MIN_SEC
+        await asyncio.sleep(max(delay, CACHE_TTL_MIN_SEC))
+
+# Serialized "no blackout" bodies keyed by (pre_minutes, post_minutes); the
+# query bounds cap this at 241 * 241 small entries.
+_NEGATIVE_BODIES: Dict[Tuple[int, int], bytes] = {}
+
+def _negative_body(pre_minutes: int, post_minutes: int) -> bytes:
+    key = (pre_minutes, post_minutes)
+    body = _NEGATIVE_BODIES.get(key)
+    if body is None:
+        body = _NEGATIVE_BODIES[key] = orjson.dumps(
             {
-                "event": title,
-                "currency": "USD",
-                "impact": "High",
-                "event_time_utc": dt,
+                "us_news_blackout": False,
+                "pre_minutes": pre_minutes,
+                "post_minutes": post_minutes,
+                "source": PROVIDER.source,
             }
         )
-
-    _CACHE["ts"] = now_ts
-    _CACHE["data"] = events
-    return events
+    return body
 
 # =========================
 # ROUTES
 # =========================
+_HEALTH_BODY = b'{"ok":true}'
+
 @app.get("/health")
-def health():
-    return {"ok": True}
+async def health():
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 @app.get("/us_news_status")
 async def us_news_status(
     token: str = Query(..., description="Shared secret token"),
     pre_minutes: int = Query(DEFAULT_PRE_MIN, ge=0, le=240),
     post_minutes: int = Query(DEFAULT_POST_MIN, ge=0, le=240),
+    client: httpx.AsyncClient = Depends(_get_http),
 ):
-    if not BRIDGE_TOKEN or token != BRIDGE_TOKEN:
+    # Constant-time compare so response timing does not leak the token prefix
+    if not _TOKEN_BYTES or not hmac.compare_digest(token.encode(), _TOKEN_BYTES):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    now = _now_utc()
-    events = await _fetch_us_high_impact_events()
+    now_ts = time.time()
+    s = await _fetch_us_high_impact_events(client)
+    epochs = s.epochs
+    pre_sec = pre_minutes * 60
+    post_sec = post_minutes * 60
 
-    # Find any event currently in blackout
-    for ev in events:
-        dt: datetime = ev["event_time_utc"]
-        if _is_blackout(now, dt, pre_minutes, post_minutes):
-            end_ts = dt.timestamp() + (post_minutes * 60)
-            minutes_to_clear = max(0, int((end_ts - now.timestamp()) / 60))
-            return {
+    # Find any event currently in blackout: now is inside an event's window
+    # iff the event falls in [now - post, now + pre], so bisect to the first
+    # event after now - post and check it against now + pre.
+    i = bisect_left(epochs, now_ts - post_sec)
+    if i < len(epochs) and epochs[i] <= now_ts + pre_sec:
+        e = epochs[i]
+        minutes_to_clear = max(0, int((e + post_sec - now_ts) / 60))
+        body = orjson.dumps(
+            {
                 "us_news_blackout": True,
-                "event": ev.get("event", ""),
+                "event": s.titles[i],
                 "currency": "USD",
                 "impact": "High",
-                "event_time_utc": dt.isoformat(),
+                # Only the matched event is ever turned back into a datetime
+                "event_time_utc": datetime.fromtimestamp(e, tz=timezone.utc).isoformat(),
                 "minutes_to_clear": minutes_to_clear,
                 "pre_minutes": pre_minutes,
                 "post_minutes": post_minutes,
-                "source": "ff_thisweek_xml",
+                "source": PROVIDER.source,
             }
+        )
+        return Response(content=body, media_type="application/json")
 
-    return {
-        "us_news_blackout": False,
-        "pre_minutes": pre_minutes,
-        "post_minutes": post_minutes,
-        "source": "ff_thisweek_xml",
-    }
+    return Response(content=_negative_body(pre_minutes, post_minutes), media_type="application/json")
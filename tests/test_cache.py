@@ -0,0 +1,154 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+
+import main
+
+FEED = (
+    b"<weeklyevents><event><title>CPI m/m</title><currency>USD</currency>"
+    b"<impact>High</impact><timestamp>1767000000</timestamp></event></weeklyevents>"
+)
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache(monkeypatch):
+    monkeypatch.setattr(main, "_snap", None)
+    monkeypatch.setattr(main, "_refresh_task", None)
+    monkeypatch.setattr(main, "PROVIDER", main.FFProvider())
+
+
+def _client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_failed_background_refresh_is_logged(caplog):
+    async def go():
+        async with _client(lambda req: httpx.Response(500, content=b"down")) as client:
+            with pytest.raises(Exception):
+                await main._fetch_us_high_impact_events(client, force=True)
+
+    with caplog.at_level(logging.WARNING, logger="main"):
+        asyncio.run(go())
+    assert any("Calendar refresh failed" in r.getMessage() for r in caplog.records)
+
+
+def test_shutdown_cancels_in_flight_refresh(monkeypatch):
+    async def slow(req):
+        await asyncio.sleep(30)
+        return httpx.Response(200, content=FEED)
+
+    real_client = httpx.AsyncClient
+
+    def client_factory(*args, **kwargs):
+        kwargs["transport"] = httpx.MockTransport(slow)
+        return real_client(*args, **kwargs)
+
+    monkeypatch.setattr(main.httpx, "AsyncClient", client_factory)
+
+    async def go():
+        async with main.lifespan(main.app):
+            await asyncio.sleep(0.05)
+            assert main._refresh_task is not None and not main._refresh_task.done()
+        assert main._refresh_task.done()
+
+    asyncio.run(go())
+
+
+def _stale_snap(age: float) -> main.Snap:
+    now = main.time.time()
+    return main.Snap(ts=now - age, expires_at=now - 1, epochs=main.array("d", [1.0]), titles=("old",))
+
+
+def test_304_keeps_previous_columns():
+    seen = []
+
+    def handler(req):
+        seen.append(req.headers.get("if-none-match"))
+        if req.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=FEED, headers={"etag": '"v1"'})
+
+    async def go():
+        async with _client(handler) as client:
+            first = await main._fetch_us_high_impact_events(client, force=True)
+            second = await main._fetch_us_high_impact_events(client, force=True)
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert seen == [None, '"v1"']
+    assert second.epochs is first.epochs
+    assert second.titles == ("CPI m/m",)
+    assert second.etag == '"v1"'
+    assert second.ts >= first.ts
+    assert main._snap is second
+
+
+def test_concurrent_misses_share_one_fetch():
+    calls = 0
+
+    async def handler(req):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=FEED)
+
+    async def go():
+        async with _client(handler) as client:
+            return await asyncio.gather(*(main._fetch_us_high_impact_events(client) for _ in range(20)))
+
+    snaps = asyncio.run(go())
+    assert calls == 1
+    assert all(s is snaps[0] for s in snaps)
+
+
+def test_stale_snapshot_served_while_refreshing():
+    calls = 0
+
+    async def handler(req):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=FEED)
+
+    stale = _stale_snap(age=main.CACHE_TTL_SEC + 1)
+    main._snap = stale
+
+    async def go():
+        async with _client(handler) as client:
+            served = await asyncio.gather(*(main._fetch_us_high_impact_events(client) for _ in range(10)))
+            assert all(s is stale for s in served)
+            refreshed = await main._refresh_task
+        return refreshed
+
+    refreshed = asyncio.run(go())
+    assert calls == 1
+    assert main._snap is refreshed
+    assert refreshed.titles == ("CPI m/m",)
+
+
+def test_snapshot_past_hard_ttl_waits_for_refresh():
+    main._snap = _stale_snap(age=main.HARD_TTL_SEC + 1)
+
+    async def go():
+        async with _client(lambda req: httpx.Response(200, content=FEED)) as client:
+            return await main._fetch_us_high_impact_events(client)
+
+    assert asyncio.run(go()).titles == ("CPI m/m",)
+
+
+@pytest.mark.parametrize(
+    "epochs, expected",
+    [
+        ((), main.CACHE_TTL_SEC),
+        ((-50.0,), main.CACHE_TTL_SEC),
+        ((10.0,), main.CACHE_TTL_MIN_SEC),
+        ((main.CACHE_REFRESH_LEAD_SEC + 100.0,), max(main.CACHE_TTL_MIN_SEC, 100.0)),
+        ((main.CACHE_REFRESH_LEAD_SEC + 10 * main.CACHE_TTL_SEC,), main.CACHE_TTL_SEC),
+    ],
+)
+def test_adaptive_ttl_bounds(epochs, expected):
+    ttl = main._adaptive_ttl(epochs, 0.0)
+    assert ttl == expected
+    assert main.CACHE_TTL_MIN_SEC <= ttl <= main.CACHE_TTL_SEC
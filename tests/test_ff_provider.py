@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import main
+
+USD_HIGH = (
+    "<currency>USD</currency><impact><![CDATA[High]]></impact>"
+    "<timestamp>1767000000</timestamp>"
+)
+
+
+def _read(body: bytes):
+    async def go():
+        transport = httpx.MockTransport(lambda req: httpx.Response(200, content=body))
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "https://calendar.test/ff.xml") as r:
+                return await main.FFProvider().read(r)
+
+    return asyncio.run(go())
+
+
+def test_plain_feed():
+    epochs, titles = _read(
+        b'<?xml version="1.0" encoding="windows-1252"?><weeklyevents>'
+        b"<event><title>CPI m/m</title>" + USD_HIGH.encode() + b"</event>"
+        b"<event><title>Caf\xe9</title><currency>EUR</currency><impact>High</impact>"
+        b"<timestamp>1767000000</timestamp></event>"
+        b"</weeklyevents>"
+    )
+    assert list(epochs) == [1767000000.0]
+    assert titles == ["CPI m/m"]
+
+
+def test_event_with_attributes():
+    epochs, titles = _read(
+        b'<weeklyevents><event id="1"><title>NFP</title>' + USD_HIGH.encode() + b"</event></weeklyevents>"
+    )
+    assert list(epochs) == [1767000000.0]
+    assert titles == ["NFP"]
+
+
+def test_nested_event_title():
+    epochs, titles = _read(
+        b"<weeklyevents><event><event>FOMC Statement</event>" + USD_HIGH.encode() + b"</event></weeklyevents>"
+    )
+    assert list(epochs) == [1767000000.0]
+    assert titles == ["FOMC Statement"]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"",
+        b"not xml",
+        b"<weeklyevents><event>",
+        b"<weeklyevents><event>" + USD_HIGH.encode() + b"</event>",
+        b"<weeklyevents><event>" + USD_HIGH.encode() + b"</event><broken></weeklyevents>",
+    ],
+)
+def test_damaged_feed_is_rejected(body):
+    with pytest.raises(HTTPException) as exc:
+        _read(body)
+    assert exc.value.status_code == 502
+
+
+@pytest.mark.parametrize(
+    "currency, impact",
+    [("USD", "High"), ("usd", "high"), ("Usd", "HIGH"), ("USD", "HIGH")],
+)
+def test_accepted_spellings(currency, impact):
+    epochs, titles = _read(
+        f"<weeklyevents><event><title>GDP</title><currency>{currency}</currency>"
+        f"<impact>{impact}</impact><timestamp>1767000000</timestamp></event></weeklyevents>".encode()
+    )
+    assert titles == ["GDP"]
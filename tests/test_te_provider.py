@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import main
+
+NFP = {"Country": "United States", "Event": "Non Farm Payrolls", "Importance": 3, "Date": "2025-12-05T13:30:00"}
+NFP_TS = 1764941400.0
+
+
+def _read(body: bytes):
+    async def go():
+        transport = httpx.MockTransport(lambda req: httpx.Response(200, content=body))
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "https://calendar.test/te.json") as r:
+                return await main.TEProvider().read(r)
+
+    return asyncio.run(go())
+
+
+def test_accepted_row():
+    epochs, titles = _read(orjson.dumps([NFP]))
+    assert list(epochs) == [NFP_TS]
+    assert titles == ["Non Farm Payrolls"]
+
+
+def test_explicit_offset_is_kept():
+    epochs, _ = _read(orjson.dumps([dict(NFP, Date="2025-12-05T08:30:00-05:00")]))
+    assert list(epochs) == [NFP_TS]
+
+
+def test_non_us_and_low_importance_rows_are_skipped():
+    epochs, titles = _read(
+        orjson.dumps(
+            [
+                dict(NFP, Country="Euro Area"),
+                dict(NFP, Importance=1),
+                dict(NFP, Event="Kept"),
+            ]
+        )
+    )
+    assert titles == ["Kept"]
+    assert len(epochs) == 1
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        "junk",
+        None,
+        dict(NFP, Event=5),
+        dict(NFP, Event=["x"]),
+        dict(NFP, Date=12345),
+        dict(NFP, Date=["2025-12-05"]),
+        dict(NFP, Date="not a date"),
+        {k: v for k, v in NFP.items() if k != "Date"},
+    ],
+)
+def test_malformed_rows_are_skipped(row):
+    epochs, titles = _read(orjson.dumps([row, dict(NFP, Event="Kept")]))
+    assert titles == ["Kept"]
+    assert list(epochs) == [NFP_TS]
+
+
+@pytest.mark.parametrize("body", [b"", b"{bad", b'{"Event": "x"}', b'"text"'])
+def test_bad_body_is_rejected(body):
+    with pytest.raises(HTTPException) as exc:
+        _read(body)
+    assert exc.value.status_code == 502